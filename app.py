@@ -1,78 +1,130 @@
 import os
 import io
 import csv
+import hashlib
+import itertools
+import re
+import threading
 import zipfile
-import tempfile
+import orjson
 import requests
+from collections import OrderedDict
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
-# Load environment variables
-load_dotenv()
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson so jsonify and request parsing avoid the stdlib encoder"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Reject oversized uploads before Werkzeug parses them into the request
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
 CORS(app)  # Enable CORS for all routes
 
-# Get AI Proxy Token from environment variables
-AI_PROXY_TOKEN = os.getenv('AI_PROXY_TOKEN')
-AI_PROXY_URL = os.getenv('AI_PROXY_URL', 'https://aiproxy.sanand.workers.dev/')
+@dataclass(frozen=True)
+class Config:
+    """Settings read once from the environment at startup"""
+    ai_proxy_token: str | None
+    ai_proxy_url: str
 
-ALLOWED_EXTENSIONS = {'csv', 'zip', 'txt', 'pdf', 'xlsx', 'json'}
+def load_config():
+    """Load environment variables (including a local .env file) into a Config"""
+    load_dotenv()
+    return Config(
+        ai_proxy_token=os.getenv('AI_PROXY_TOKEN') or None,
+        ai_proxy_url=os.getenv('AI_PROXY_URL') or 'https://aiproxy.sanand.workers.dev/'
+    )
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+CFG = load_config()
+if not CFG.ai_proxy_token:
+    # Files with an "answer" column still work, so warn at startup instead of refusing to boot
+    app.logger.warning("AI_PROXY_TOKEN is not set; questions that need the AI service will fail")
 
-def process_zip_file(file):
-    """Extract and process content from a ZIP file"""
-    with tempfile.NamedTemporaryFile(delete=False) as temp:
-        file.save(temp.name)
-        file_contents = {}
-        with zipfile.ZipFile(temp.name, 'r') as zip_ref:
-            # Prioritize CSV files and look for "answer" column
-            for file_info in zip_ref.infolist():
-                if file_info.filename.lower().endswith('.csv'):
-                    with zip_ref.open(file_info) as f:
-                        csv_content = f.read().decode('utf-8', errors='ignore')
-                        reader = csv.reader(io.StringIO(csv_content))
-                        rows = list(reader)
-                        
-                        # Check for "answer" column and return first value
-                        if rows and 'answer' in rows[0]:
-                            answer_idx = rows[0].index('answer')
-                            if len(rows) > 1 and len(rows[1]) > answer_idx:
-                                file_contents[file_info.filename] = {
-                                    'type': 'csv',
-                                    'direct_answer': rows[1][answer_idx],
-                                    'headers': rows[0],
-                                    'data': rows[1:],
-                                    'raw': csv_content
-                                }
-                                continue
-                        
-                        file_contents[file_info.filename] = {
-                            'type': 'csv',
-                            'headers': rows[0] if rows else [],
-                            'data': rows[1:] if len(rows) > 1 else [],
-                            'raw': csv_content
-                        }
-        os.unlink(temp.name)
-        return file_contents
+# Seconds to wait on the AI proxy before giving up, so a stalled call can't pin a worker forever
+AI_REQUEST_TIMEOUT = 60
 
-def process_csv_file(file):
-    """Process a CSV file and return structured data, ensuring robust handling of edge cases"""
-    stream = io.StringIO(file.stream.read().decode("utf-8"), newline=None)
-    file.stream.seek(0)  # Reset file pointer for potential reuse
-    rows = list(csv.reader(stream))
-    headers = rows[0] if rows else []
-    data = rows[1:] if len(rows) > 1 else []
+# Shared HTTP session so connections to the AI proxy are kept alive and reused across requests
+SESSION = requests.Session()
+SESSION.headers.update({
+    "Authorization": f"Bearer {CFG.ai_proxy_token}",
+    "Content-Type": "application/json"
+})
+SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+SESSION.mount('http://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+AI_MODEL = "gpt-4o-mini"
+AI_MAX_TOKENS = 256
+
+# First line of a plain-text AI reply, without surrounding whitespace or code-block backticks
+ANSWER_CLEANUP_RE = re.compile(r'^[\s`]*([^\n]*?)[\s`]*(?:\n|$)')
+
+SYSTEM_MSG = (
+    "You are a helpful assistant for IIT Madras Data Science students. "
+    'Always reply with a JSON object of the form {"answer": "<value>"}.'
+)
+
+ALLOWED_EXTENSIONS = frozenset({'csv', 'zip', 'txt', 'pdf', 'xlsx', 'json'})
+
+# Exact-match cache of AI answers so repeated questions skip the LLM round trip
+ANSWER_CACHE_SIZE = 4096
+_answer_cache = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+class PendingCall:
+    """An AI call in flight; identical requests wait on done and then share its result"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+# AI calls currently in flight, so identical concurrent requests share one round trip
+_pending_calls = {}
+
+# Longest a request waits on an identical call; the requests timeout is per read, not total
+AI_WAIT_TIMEOUT = 90
+
+# Largest total uncompressed size accepted for a ZIP upload, to refuse ZIP bombs
+MAX_ZIP_UNCOMPRESSED_SIZE = 100 * 1024 * 1024
+
+# Number of CSV data rows kept per file; the AI context only ever shows this many
+SAMPLE_ROWS = 3
+
+# Bytes read from other file types; the AI context only shows the first 100 characters
+TEXT_SAMPLE_BYTES = 4096
+
+def allowed_file(filename):
+    _, dot, extension = filename.rpartition('.')
+    return bool(dot) and extension.lower() in ALLOWED_EXTENSIONS
+
+def parse_csv_stream(stream):
+    """Read the header and the few data rows we need from a CSV text stream"""
+    reader = csv.reader(stream)
+    headers = next(reader, [])
     
     # Check if there's an "answer" column and handle potential missing data
     answer_col_index = -1
     if 'answer' in headers:
         answer_col_index = headers.index('answer')
     
+    # With an answer column only the first row matters, so stop reading there
+    data = list(itertools.islice(reader, 1 if answer_col_index >= 0 else SAMPLE_ROWS))
+    
     # If answer column exists and has data, extract the first value
     direct_answer = None
     if answer_col_index >= 0 and data:
@@ -85,131 +137,213 @@ def process_csv_file(file):
         'direct_answer': direct_answer
     }
 
+def process_zip_file(file):
+    """Extract and process content from a ZIP file"""
+    file_contents = {}
+    # Werkzeug spools uploads to a seekable BytesIO/temp file already, so ZipFile can read it in place
+    with zipfile.ZipFile(file.stream, 'r') as zip_ref:
+        if sum(file_info.file_size for file_info in zip_ref.infolist()) > MAX_ZIP_UNCOMPRESSED_SIZE:
+            raise ValueError("ZIP file contents are too large")
+        
+        # Prioritize CSV files and look for "answer" column
+        for file_info in zip_ref.infolist():
+            # Skip other entries before opening them so they are never decompressed
+            if not file_info.filename.lower().endswith('.csv'):
+                continue
+            with io.TextIOWrapper(zip_ref.open(file_info), encoding='utf-8', errors='ignore', newline='') as f:
+                file_contents[file_info.filename] = {
+                    'type': 'csv',
+                    **parse_csv_stream(f)
+                }
+    return file_contents
+
+def process_csv_file(file):
+    """Process a CSV file and return structured data, ensuring robust handling of edge cases"""
+    # Decode the upload incrementally instead of copying it into a str first
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8', errors='ignore', newline='')
+    try:
+        return parse_csv_stream(stream)
+    finally:
+        stream.detach()  # Leave the upload stream open for Werkzeug to clean up
+
+def process_text_file(file):
+    """Read the head of any other file type as text"""
+    return file.stream.read(TEXT_SAMPLE_BYTES).decode('utf-8', errors='ignore')
+
+# File extension -> (handler, key its result is stored under); anything else is read as text
+FILE_HANDLERS = {
+    'zip': (process_zip_file, 'contents'),
+    'csv': (process_csv_file, 'content'),
+}
+
 def extract_data_from_file(file):
     """Extract data from uploaded file based on its type"""
     if not file or not file.filename:
         return None
         
     filename = secure_filename(file.filename)
-    file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
     
-    if file_extension == 'zip':
-        return {
-            'file_type': 'zip',
-            'filename': filename,
-            'contents': process_zip_file(file)
-        }
-    elif file_extension == 'csv':
-        return {
-            'file_type': 'csv',
-            'filename': filename,
-            'content': process_csv_file(file)
-        }
-    else:
-        # For other file types, read as text
-        content = file.read().decode('utf-8', errors='ignore')
-        return {
-            'file_type': file_extension,
-            'filename': filename,
-            'content': content
-        }
+    # Hash the upload so identical files share cached AI answers
+    file.stream.seek(0)
+    file_hash = hashlib.file_digest(file.stream, 'sha256').hexdigest()
+    file.stream.seek(0)
+    _, dot, file_extension = filename.rpartition('.')
+    file_extension = file_extension.lower() if dot else ''
+    
+    handler, key = FILE_HANDLERS.get(file_extension, (process_text_file, 'content'))
+    return {
+        'file_type': file_extension,
+        'filename': filename,
+        key: handler(file),
+        'file_hash': file_hash
+    }
+
+def wait_for_answer(key):
+    """Return a cached answer for key, or the result of an identical AI call already in flight.
+
+    Returns None when neither exists; the caller is then registered as the one making
+    the AI call and must pass its result to finish_ai_call(key, result) once it is done.
+    """
+    with _answer_cache_lock:
+        answer = _answer_cache.get(key)
+        if answer is not None:
+            _answer_cache.move_to_end(key)
+            return {"answer": answer}, 200
+        pending = _pending_calls.get(key)
+        if pending is None:
+            _pending_calls[key] = PendingCall()
+            return None
+    # Share the other call's result, failures included, rather than retrying one by one
+    if not pending.done.wait(AI_WAIT_TIMEOUT):
+        return {"error": "AI service error: timed out waiting for the AI service"}, 500
+    return pending.result
+
+def finish_ai_call(key, result):
+    """Hand the result of the AI call registered for key to the requests waiting on it"""
+    with _answer_cache_lock:
+        pending = _pending_calls.pop(key)
+    pending.result = result
+    pending.done.set()
+
+def cache_answer(key, answer):
+    """Remember an AI answer, evicting the least recently used entry when full"""
+    with _answer_cache_lock:
+        _answer_cache[key] = answer
+        _answer_cache.move_to_end(key)
+        if len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+def find_direct_answer(file_data):
+    """Return the first value of an "answer" column in the uploaded CSV data, or None"""
+    if not file_data:
+        return None
+    if file_data.get('file_type') == 'zip':
+        for content in file_data.get('contents', {}).values():
+            if content.get('direct_answer'):
+                return content['direct_answer']
+    elif file_data.get('file_type') == 'csv':
+        return file_data.get('content', {}).get('direct_answer') or None
+    return None
 
 def get_answer_from_ai(question, file_data=None):
     """Get answer from AI service using the proxy token"""
     
-    # First check for direct answers in files
-    if file_data:
-        # Check ZIP files first
-        if file_data.get('file_type') == 'zip':
-            for filename, content in file_data.get('contents', {}).items():
-                if content.get('direct_answer'):
-                    return {"answer": content['direct_answer']}, 200
-                
-        # Then check single CSV files
-        elif file_data.get('file_type') == 'csv':
-            direct_answer = file_data.get('content', {}).get('direct_answer')
-            if direct_answer:
-                return {"answer": direct_answer}, 200
+    # Files that already carry the answer never need the AI service
+    direct_answer = find_direct_answer(file_data)
+    if direct_answer:
+        return {"answer": direct_answer}, 200
 
-    if not AI_PROXY_TOKEN or not AI_PROXY_URL:
-        return {"error": "AI Proxy Token or URL not configured"}, 500
+    if not CFG.ai_proxy_token:
+        return {"error": "AI Proxy Token not configured"}, 500
 
-    # Special handling for direct answers in CSV files
-    if file_data and file_data.get('file_type') == 'csv' and file_data.get('content', {}).get('direct_answer'):
-        return {"answer": file_data['content']['direct_answer']}, 200
-        
-    # Special handling for CSVs inside ZIP files
-    if file_data and file_data.get('file_type') == 'zip':
-        for filename, content in file_data.get('contents', {}).items():
-            if content.get('type') == 'csv' and 'answer' in content.get('headers', []):
-                answer_idx = content['headers'].index('answer')
-                if content.get('data') and len(content['data'][0]) > answer_idx:
-                    return {"answer": content['data'][0][answer_idx]}, 200
+    # Reuse earlier answers for the same question and file before building any context
+    cache_key = (question, file_data.get('file_hash') if file_data else None)
+    shared_result = wait_for_answer(cache_key)
+    if shared_result is not None:
+        return shared_result
+
+    result = {"error": "Unexpected error: AI call did not complete"}, 500
+    try:
+        result = ask_ai(question, file_data)
+        response, status_code = result
+        if status_code == 200 and response["answer"]:
+            cache_answer(cache_key, response["answer"])
+        return result
+    finally:
+        finish_ai_call(cache_key, result)
 
+def ask_ai(question, file_data=None):
+    """Build the prompt for a question and its file data and send it to the AI service"""
     # Prepare a structured context for the AI, ensuring clarity in the prompt
-    context = ""
+    parts = []
     if file_data:
         if file_data.get('file_type') == 'zip':
-            context += f"File: {file_data.get('filename')}\n"
-            context += "Contents:\n"
+            parts.append(f"File: {file_data.get('filename')}\n")
+            parts.append("Contents:\n")
             for filename, content in file_data.get('contents', {}).items():
                 if content.get('type') == 'csv':
-                    context += f"- {filename} (CSV file)\n"
-                    context += f"  Headers: {', '.join(content.get('headers', []))}\n"
-                    context += f"  Data sample: {content.get('data', [])[:3]}\n"
+                    parts.append(f"- {filename} (CSV file)\n")
+                    parts.append(f"  Headers: {', '.join(content.get('headers', []))}\n")
+                    parts.append(f"  Data sample: {content.get('data', [])[:3]}\n")
                 else:
-                    context += f"- {filename} (Content sample: {content.get('content', '')[:100]}...)\n"
+                    parts.append(f"- {filename} (Content sample: {content.get('content', '')[:100]}...)\n")
         elif file_data.get('file_type') == 'csv':
-            context += f"File: {file_data.get('filename')} (CSV)\n"
-            context += f"Headers: {file_data.get('content', {}).get('headers', [])}\n"
-            context += f"Data sample: {file_data.get('content', {}).get('data', [])[:3]}\n"
+            parts.append(f"File: {file_data.get('filename')} (CSV)\n")
+            parts.append(f"Headers: {file_data.get('content', {}).get('headers', [])}\n")
+            parts.append(f"Data sample: {file_data.get('content', {}).get('data', [])[:3]}\n")
         else:
-            context += f"File: {file_data.get('filename')} (Content sample: {file_data.get('content', '')[:100]}...)\n"
+            parts.append(f"File: {file_data.get('filename')} (Content sample: {file_data.get('content', '')[:100]}...)\n")
+    context = "".join(parts)
 
     # Prepare the prompt
-    prompt = f"""
-    You are a helper for IIT Madras Online Degree in Data Science course. 
-    
-    Task: Provide the answer to the following question from a graded assignment:
-    
-    Question: {question}
-    
-    {context}
-    
-    Important: Your response must be ONLY the answer value, without any explanation or additional text.
-    The answer should be the exact value that would be entered in the assignment form.
-    """
+    prompt = "\n".join([
+        "You are a helper for IIT Madras Online Degree in Data Science course.",
+        "",
+        "Task: Provide the answer to the following question from a graded assignment:",
+        "",
+        f"Question: {question}",
+        "",
+        context,
+        'Important: Your response must be ONLY a JSON object of the form {"answer": "<value>"}, without any explanation or additional text.',
+        "The value should be the exact answer that would be entered in the assignment form.",
+    ])
 
     # Make API request to AI service
-    headers = {
-        "Authorization": f"Bearer {AI_PROXY_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
-        "model": "gpt-4",  # Using GPT-4 for higher accuracy
+        "model": AI_MODEL,  # Small model: the task is returning a single short value
         "messages": [
-            {"role": "system", "content": "You are a helpful assistant for IIT Madras Data Science students."},
+            {"role": "system", "content": SYSTEM_MSG},
             {"role": "user", "content": prompt}
         ],
-        "temperature": 0.1  # Low temperature for more deterministic output
+        "temperature": 0,  # Deterministic output so cached answers stay valid
+        "response_format": {"type": "json_object"},
+        "max_tokens": AI_MAX_TOKENS
     }
     
     try:
-        response = requests.post(AI_PROXY_URL, headers=headers, json=payload)
+        response = SESSION.post(CFG.ai_proxy_url, json=payload, timeout=AI_REQUEST_TIMEOUT)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Extract the answer from the response
-        answer = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-        
-        # Clean up the answer - remove any markdown formatting or extra text
-        answer = answer.strip()
-        answer = answer.strip('`')  # Remove code block formatting
+        content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
         
-        # If the answer contains multiple lines, take only the first line
-        if '\n' in answer:
-            answer = answer.split('\n')[0].strip()
+        try:
+            reply = orjson.loads(content)
+        except (orjson.JSONDecodeError, TypeError):
+            # The model ignored the JSON format (or was cut off), so clean up the raw text
+            match = ANSWER_CLEANUP_RE.match(content)
+            answer = match.group(1) if match else content.strip()
+            # A truncated JSON object is not an answer
+            if answer.startswith('{'):
+                answer = ''
+        else:
+            # JSON of any other shape, or a null answer, means the model gave no answer
+            answer = reply.get('answer') if isinstance(reply, dict) else None
+            if answer is None:
+                answer = ''
+            elif not isinstance(answer, str):
+                answer = orjson.dumps(answer).decode('utf-8')
             
         return {"answer": answer}, 200
     
@@ -255,10 +389,17 @@ def solve_question():
         else:
             return jsonify(response), status_code
             
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         app.logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.errorhandler(RequestEntityTooLarge)
+def file_too_large(e):
+    """Return a JSON error for uploads over MAX_CONTENT_LENGTH"""
+    return jsonify({"error": "File too large"}), 413
+
 @app.route('/', methods=['GET'])
 def home():
     """Home route to confirm the API is running"""
@@ -268,7 +409,7 @@ def home():
     })
 
 def ensure_test_files():
-    """Create test files if they don't exist"""
+    """Create test files if they don't exist or are out of date"""
     test_files_dir = os.path.join(os.path.dirname(__file__), 'test_files')
     os.makedirs(test_files_dir, exist_ok=True)
 
@@ -277,6 +418,9 @@ def ensure_test_files():
     zip_path = os.path.join(test_files_dir, 'sample.zip')
     
     if os.path.exists(csv_path):
+        # Reuse the existing ZIP unless the CSV has changed since it was built
+        if os.path.exists(zip_path) and os.path.getmtime(zip_path) >= os.path.getmtime(csv_path):
+            return zip_path
         try:
             # Create new ZIP file with the CSV
             with zipfile.ZipFile(zip_path, 'w') as zf:
@@ -316,11 +460,13 @@ def test():
                     files=files,
                     data=data
                 )
+                # The API always replies in UTF-8 JSON; skip charset detection on .text
+                response.encoding = 'utf-8'
                 
                 app.logger.info(f"API Response: {response.status_code} - {response.text}")
                 
                 if response.ok:
-                    return jsonify(response.json()), response.status_code
+                    return jsonify(orjson.loads(response.content)), response.status_code
                 else:
                     return jsonify({
                         "status": "error",
@@ -344,4 +490,5 @@ def test():
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Development server only; run gunicorn -c gunicorn_conf.py app:app in production
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_ENV') == 'development')
@@ -0,0 +1,14 @@
+import multiprocessing
+import os
+
+# Gunicorn settings for production: gunicorn -c gunicorn_conf.py app:app
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threaded workers so the slow, blocking AI proxy calls run in parallel
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# AI proxy calls can take up to AI_REQUEST_TIMEOUT (60s) on their own
+timeout = 90
+keepalive = 65